@@ -38,55 +38,124 @@ Next steps:
 import sim
 import os
 import csv
+import collections
+import numpy as np
+from array import array
+
+# Core states are 0..6 (NUM_STATES = 7) and would fit in 3 bits, but samples
+# are deliberately kept at one uint8 each: the buffers are scanned with NumPy
+# byte compares and exported digit-by-digit, neither of which works on a
+# packed bitstream without an unpack pass that costs more than it saves.
+STATE_IDLE = 5
+
+# Maps a state byte to its ASCII digit ('?' for out-of-range values), so a
+# whole state row can be formatted with one C-level bytes.translate call.
+_STATE_TO_DIGIT = bytes(0x30 + b if b < 10 else 0x3f for b in range(256))
 
 class CoreStateAnalyzer:
-    """Individual core analyzer - one instance per core"""
-    def __init__(self, core_id, results_folder, observation_window, sampling_period):
+    """Individual core analyzer - one instance per core.
+
+    Records are kept structure-of-arrays style: one flat column per record
+    field, indexed by (event_id - 1), plus a file-backed byte buffer holding
+    one state byte per sample.  Compared to one dict plus a list of tuples
+    per event this costs one byte per sample instead of hundreds, and the
+    end-of-simulation scans walk contiguous buffers instead of chasing
+    pointers.
+    """
+    __slots__ = ('core_id', 'results_folder', 'max_slots', '_window_fs', 'ips',
+                 'branch_takens', 'start_times', 'deadlines', 'instruction_counts',
+                 'slot_counts', 'states_path', 'states_mm', '_states_rows',
+                 'active_indices', 'completed_count')
+
+    def __init__(self, core_id, results_folder, window_fs, max_slots):
         self.core_id = core_id
         self.results_folder = results_folder
-        self.observation_window = observation_window
-        self.sampling_period = sampling_period
-        
-        self.active_records = {}        # key=event_id, value=record dict
-        self.completed_records = []     # store completed records in memory
-        self.next_event_id = 1         # track the next available event ID for this core
+
+        # Both derived once in setup(): the observation window in
+        # femtoseconds, and the widest number of samples it can produce.
+        self._window_fs = window_fs
+        self.max_slots = max_slots
+
+        # One entry per recorded branch event, indexed by event_id - 1.
+        self.ips = array('Q')
+        self.branch_takens = bytearray()
+        self.start_times = array('q')
+        self.deadlines = array('q')     # start_time + window, precomputed
+        self.instruction_counts = array('q')
+        self.slot_counts = array('i')
+
+        # Flat per-sample state storage, one max_slots-wide row per event,
+        # backed by a scratch file in the results folder so process RSS does
+        # not grow with simulation length. Grown in whole-record chunks;
+        # rows are zeroed up front (truncate extends with zeros).
+        self.states_path = os.path.join(results_folder, 'core_state_samples.%d.bin' % core_id)
+        self.states_mm = None
+        self._states_rows = 0
+
+        # Records still inside their window. Start times are monotonic and
+        # the window is fixed, so records expire strictly in FIFO order.
+        self.active_indices = collections.deque()
+        self.completed_count = 0
 
     def record_branch_event(self, ip, predicted, actual, indirect):
         """Record a new branch event for this core."""
-        event_id = self.next_event_id
-        self.next_event_id += 1
-        
-        record = {
-            'event_id': event_id,
-            'core_id': self.core_id,
-            'ip': ip,
-            'branch_taken': actual,
-            'start_time': sim.stats.time(),
-            'instruction_count': sim.stats.get('performance_model', self.core_id, 'instruction_count'),
-            'states': []
-        }
-        
-        self.active_records[event_id] = record
-        #print(f"[DEBUG] Core {self.core_id}: New branch event {event_id} at IP {hex(ip)}")
-
-    def collect_state_sample(self, time, time_delta):
+        start_time = sim.stats.time()
+        self.ips.append(ip)
+        self.branch_takens.append(1 if actual else 0)
+        self.start_times.append(start_time)
+        self.deadlines.append(start_time + self._window_fs)
+        self.instruction_counts.append(sim.stats.get('performance_model', self.core_id, 'instruction_count'))
+        self.slot_counts.append(0)
+        if len(self.ips) > self._states_rows:
+            self._grow_states()
+        self.active_indices.append(len(self.ips) - 1)
+        #print(f"[DEBUG] Core {self.core_id}: New branch event {len(self.ips)} at IP {hex(ip)}")
+
+    def collect_state_sample(self, time, current_state):
         """Collect state samples for this core's active recording windows."""
-        if time_delta == 0:
-            return
+        # Bind hot attributes to locals: LOAD_FAST instead of an attribute
+        # lookup per active record per tick.
+        active_indices = self.active_indices
+        states_mm = self.states_mm
+        slot_counts = self.slot_counts
+        max_slots = self.max_slots
+        deadlines = self.deadlines
+
+        # Only the state byte is stored per sample; samples sit on the fixed
+        # sampling grid, so the elapsed time of slot i is i * sampling_period.
+        for index in active_indices:
+            slot = slot_counts[index]
+            if slot < max_slots:
+                states_mm[index, slot] = current_state
+                slot_counts[index] = slot + 1
+
+        # Deadlines are monotonic, so expired records sit at the head.
+        while active_indices and time > deadlines[active_indices[0]]:
+            active_indices.popleft()
+            self.completed_count += 1
+            # print("[DEBUG] Core %d: Completed record %d" % (self.core_id, self.completed_count))
+
+    def _grow_states(self):
+        """Extend the state scratch file by 1024 records and remap it."""
+        new_rows = max(self._states_rows * 2, 1024)
+        if self.states_mm is not None:
+            self.states_mm.flush()
+            self.states_mm = None
+        with open(self.states_path, 'ab') as f:
+            f.truncate(new_rows * self.max_slots)
+        self.states_mm = np.memmap(self.states_path, dtype=np.uint8, mode='r+',
+                                   shape=(new_rows, self.max_slots))
+        self._states_rows = new_rows
+
+    def release_states(self):
+        """Drop the state memmap and remove the scratch file behind it."""
+        if self.states_mm is not None:
+            self.states_mm = None
+            os.remove(self.states_path)
 
-        current_state = sim.dvfs.get_core_state(self.core_id)
-        
-        for event_id in list(self.active_records.keys()):
-            record = self.active_records[event_id]
-            elapsed_time = time - record['start_time']
-            
-            record['states'].append((elapsed_time, current_state))
-            
-            if elapsed_time > (self.observation_window * sim.util.Time.US):
-                self.completed_records.append(record)
-                del self.active_records[event_id]
-                # print("[DEBUG] Core %d: Completed record %d with %d states" % 
-                #       (self.core_id, event_id, len(record['states'])))
+    def get_states(self, index):
+        """Return the recorded state samples of one event as a uint8 view."""
+        return self.states_mm[index, :self.slot_counts[index]]
 
 class CoreStateAtBranchEventAnalyzer:
     def __init__(self):
@@ -100,40 +169,56 @@ class CoreStateAtBranchEventAnalyzer:
 
     def setup(self, args):
         # Parse arguments similar to SCSP style
-        args = dict(enumerate((args or '').split(':')))
-        
+        parts = (args or '').split(':')
+
         # Default observation window 100 microseconds
-        self.observation_window = int(args.get(0, None) or 100)
-        
+        self.observation_window = int(parts[0]) if len(parts) > 0 and parts[0] else 100
+
         # Default sampling period 1 microsecond
-        self.sampling_period = int(args.get(1, None) or 1)
-        
+        self.sampling_period = int(parts[1]) if len(parts) > 1 and parts[1] else 1
+
+        # All time conversions happen once, here; the analyzers and the
+        # periodic hook reuse the cached values.
+        self._window_fs = int(self.observation_window * sim.util.Time.US)
+        self._sampling_fs = int(self.sampling_period * sim.util.Time.US)
+        self._max_slots = (self.observation_window + self.sampling_period - 1) // self.sampling_period + 1
+
         self.results_folder = sim.config.output_dir
         self.state_patterns_file = os.path.join(self.results_folder, "core_state_patterns.csv")
         self.analysis_summary_file = os.path.join(self.results_folder, "state_pattern_summary.csv")
-        
+
+        # Bound once for the periodic sweep
+        self._get_core_state = sim.dvfs.get_core_state
+
         # Create analyzers for each core
         num_cores = sim.config.ncores
         for core_id in range(num_cores):
             self.core_analyzers[core_id] = CoreStateAnalyzer(
-                core_id, 
+                core_id,
                 self.results_folder,
-                self.observation_window,
-                self.sampling_period
+                self._window_fs,
+                self._max_slots
             )
-        
-        # Register branch prediction callback using EveryBranch
+        self._analyzers_by_core = [self.core_analyzers[core_id] for core_id in range(num_cores)]
+
+        # Register branch prediction callback using EveryBranch. This fires
+        # for every committed branch, so forward straight to the per-core
+        # analyzer: no hand-off method and no dict probe per event.
+        analyzers_by_core = self._analyzers_by_core
         def branch_callback(ip, predicted, actual, indirect, core_id):
-            self.hook_branch_predictor(core_id, ip, predicted, actual, indirect)
-        
+            #print("[DEBUG] Branch event detected on core %d at IP %s" % (core_id, hex(ip)))
+            self.total_branches += 1
+            if core_id < num_cores:
+                analyzers_by_core[core_id].record_branch_event(ip, predicted, actual, indirect)
+
         # Register periodic callback using Every
         self.periodic_hook = sim.util.Every(
-            self.sampling_period * sim.util.Time.US,  # Convert to femtoseconds
+            self._sampling_fs,
             lambda time, time_delta: self.hook_periodic(time, time_delta)
         )
-        
+
         self.branch_hook = sim.util.EveryBranch(branch_callback)
-        
+
         print(f"[CORE_ANALYZER] Initialized {num_cores} core analyzers")
         print("[CORE_ANALYZER] Registered branch prediction and periodic callbacks")
         print(f"[CORE_ANALYZER] Observation window [us]: {self.observation_window}")
@@ -141,80 +226,120 @@ class CoreStateAtBranchEventAnalyzer:
 
     # These methods will be automatically called by Sniper's hook system
     def hook_periodic(self, time, time_delta=0):
-        """Periodic hook for state sampling - delegates to each core analyzer."""
-        for analyzer in self.core_analyzers.values():
-            analyzer.collect_state_sample(time, time_delta)
-
-    def hook_branch_predictor(self, core_id, ip, predicted, actual, indirect):
-        """Hook for branch events - delegates to appropriate core analyzer."""
-        #print("[DEBUG] Branch event detected on core %d at IP %s" % (core_id, hex(ip)))  # Add debug print
-        self.total_branches += 1
-        if core_id in self.core_analyzers:
-            self.core_analyzers[core_id].record_branch_event(ip, predicted, actual, indirect)
+        """Periodic hook for state sampling - one sweep over all core analyzers."""
+        if time_delta == 0:
+            # Degenerate tick (e.g. simulation boundary): no analyzer is
+            # entered at all.
+            return
+        get_core_state = self._get_core_state
+        for analyzer in self._analyzers_by_core:
+            analyzer.collect_state_sample(time, get_core_state(analyzer.core_id))
 
     def hook_sim_end(self):
         """Simulation end hook - combines and writes results from all cores."""
-        all_completed_records = []
-        
-        # Collect remaining active records and all completed records
+        total_records = 0
         for analyzer in self.core_analyzers.values():
-            print(f"[DEBUG] Core {analyzer.core_id} has {len(analyzer.completed_records)} completed records and {len(analyzer.active_records)} active records")
-            all_completed_records.extend(analyzer.completed_records)
-            for record in analyzer.active_records.values():
-                all_completed_records.append(record)
+            print(f"[DEBUG] Core {analyzer.core_id} has {analyzer.completed_count} completed records and {len(analyzer.active_indices)} active records")
+            total_records += len(analyzer.ips)
 
-        print(f"[DEBUG] Writing {len(all_completed_records)} total records")
+        print(f"[DEBUG] Writing {total_records} total records")
 
-        # Write all records to file
-        with open(self.state_patterns_file, 'w', newline='') as f:
+        # Write all records to file (still-active records are written as-is).
+        # The states column is formatted in bulk: one bytes.translate turns a
+        # state row into ASCII digits, and a str join inserts the commas, so
+        # no per-sample int-to-string conversion runs in Python.
+        with open(self.state_patterns_file, 'w', newline='', buffering=1 << 20) as f:
             f.write("Event_ID,Instruction_Count,Start_Time,Core_ID,Branch_IP,Branch_Taken,States\n")
-            for record in all_completed_records:
-                states_str = ','.join(str(s) for _, s in record['states'])
-                f.write(f"{record['event_id']},{record['instruction_count']},{record['start_time']},{record['core_id']},{hex(record['ip'])},{record['branch_taken']},{states_str}\n")
+            # Most branches come from a handful of hot IPs (loop backedges),
+            # so format each distinct IP once and reuse the string.
+            ip_hex_cache = {}
+            for analyzer in self.core_analyzers.values():
+                core_id = analyzer.core_id
+                for index in range(len(analyzer.ips)):
+                    ip = analyzer.ips[index]
+                    hex_ip = ip_hex_cache.get(ip)
+                    if hex_ip is None:
+                        hex_ip = ip_hex_cache[ip] = hex(ip)
+                    digits = bytes(analyzer.get_states(index)).translate(_STATE_TO_DIGIT).decode('ascii')
+                    f.write('%d,%d,%d,%d,%s,%s,%s\n' % (
+                        index + 1, analyzer.instruction_counts[index], analyzer.start_times[index],
+                        core_id, hex_ip,
+                        bool(analyzer.branch_takens[index]), ','.join(digits)))
+
+        self.generate_analysis_summary(total_records)
+
+        # The CSVs hold everything; drop the per-core scratch files.
+        for analyzer in self.core_analyzers.values():
+            analyzer.release_states()
 
-        self.generate_analysis_summary(all_completed_records)
         print(f"[CORE_ANALYZER] Total branches encountered: {self.total_branches}")
 
-    def generate_analysis_summary(self, all_records):
-        """Generate statistical summary from all cores' records."""
-        # Your existing generate_analysis_summary code, but using all_records parameter
-        pattern_stats = {}
-        total_records = len(all_records)
-
-        for record in all_records:
-            ip = hex(record['ip'])
-            branch_taken = record['branch_taken']
-            states = [s for _, s in record['states']]
-
-            idle_positions = [i for i, state in enumerate(states) if state == 5]
-
-            if idle_positions:
-                if ip not in pattern_stats:
-                    pattern_stats[ip] = {
-                        'count': 1,
-                        'idle_positions': idle_positions,
-                        'branch_taken_count': 1 if branch_taken else 0
-                    }
-                else:
-                    pattern_stats[ip]['count'] += 1
-                    pattern_stats[ip]['idle_positions'].extend(idle_positions)
-                    if branch_taken:
-                        pattern_stats[ip]['branch_taken_count'] += 1
-
-        # Write pattern summary
-        with open(self.analysis_summary_file, 'w', newline='') as f:
-            f.write("Branch_IP,Count,Avg_Idle_Position,Idle_Time_Percent,Branch_Taken_Ratio\n")
-            for ip, stats in pattern_stats.items():
-                count = stats['count']
-                idle_positions = stats['idle_positions']
-                avg_position = sum(idle_positions) / len(idle_positions)
+    def generate_analysis_summary(self, total_records):
+        """Generate statistical summary from all cores' records.
+
+        All per-sample work is done by NumPy on the contiguous per-core state
+        buffers; only records with at least one IDLE sample contribute, as
+        before.
+        """
+        ip_parts = []
+        taken_parts = []
+        idle_count_parts = []
+        idle_pos_sum_parts = []
+        positions = None                # slot index vector, shared by all cores
+
+        for analyzer in self.core_analyzers.values():
+            num_events = len(analyzer.ips)
+            if num_events == 0:
+                continue
+            states = analyzer.states_mm[:num_events]
+            idle_mask = states == STATE_IDLE
+            # Padding slots hold state 0 (RUNNING), so they never count as IDLE.
+            # One pass over the mask yields both the per-record idle counts and
+            # the record filter; records without IDLE samples are dropped here
+            # so the later grouping never sees them.
+            idle_counts = idle_mask.sum(axis=1)
+            has_idle = idle_counts > 0
+            if not has_idle.any():
+                continue
+            if positions is None:
+                positions = np.arange(analyzer.max_slots)
+            # Only running sums per record are kept: idle count and the sum of
+            # idle slot positions, from which the average falls out at the end.
+            ip_parts.append(np.frombuffer(analyzer.ips, dtype=np.uint64)[has_idle])
+            taken_parts.append(np.frombuffer(analyzer.branch_takens, dtype=np.uint8)[has_idle])
+            idle_count_parts.append(idle_counts[has_idle])
+            idle_pos_sum_parts.append((idle_mask[has_idle] * positions).sum(axis=1))
+
+        num_patterns = 0
+        with open(self.analysis_summary_file, 'w', newline='', buffering=1 << 20) as f:
+            writer = csv.writer(f)
+            writer.writerow(['Branch_IP', 'Count', 'Avg_Idle_Position', 'Idle_Time_Percent', 'Branch_Taken_Ratio'])
+            if ip_parts:
+                idle_counts = np.concatenate(idle_count_parts)
+                ips = np.concatenate(ip_parts)
+                takens = np.concatenate(taken_parts)
+                idle_pos_sums = np.concatenate(idle_pos_sum_parts)
+
+                unique_ips, group = np.unique(ips, return_inverse=True)
+                num_patterns = len(unique_ips)
+                counts = np.bincount(group)
+                idle_counts_per_ip = np.bincount(group, weights=idle_counts)
+                idle_pos_sums_per_ip = np.bincount(group, weights=idle_pos_sums)
+                taken_counts_per_ip = np.bincount(group, weights=takens)
+
+                avg_positions = idle_pos_sums_per_ip / idle_counts_per_ip
                 total_samples_per_record = self.observation_window
-                idle_percentage = (len(idle_positions) / (count * total_samples_per_record)) * 100
-                branch_taken_ratio = stats['branch_taken_count'] / count
-                f.write(f"{ip},{count},{avg_position:.2f},{idle_percentage:.2f},{branch_taken_ratio:.2f}\n")
+                idle_percentages = idle_counts_per_ip / (counts * total_samples_per_record) * 100
+                branch_taken_ratios = taken_counts_per_ip / counts
+
+                # IPs stay integers throughout aggregation; hex() only here.
+                writer.writerows([hex(ip), count, f"{avg:.2f}", f"{pct:.2f}", f"{ratio:.2f}"]
+                                 for ip, count, avg, pct, ratio
+                                 in zip(unique_ips.tolist(), counts.tolist(), avg_positions.tolist(),
+                                        idle_percentages.tolist(), branch_taken_ratios.tolist()))
 
         print(f"[CORE_ANALYZER] Analyzed {total_records} total records")
-        print(f"[CORE_ANALYZER] Found {len(pattern_stats)} branches with IDLE states")
+        print(f"[CORE_ANALYZER] Found {num_patterns} branches with IDLE states")
 
 # Register the analyzer
 analyzer = CoreStateAtBranchEventAnalyzer()